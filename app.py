@@ -4,19 +4,24 @@ import os
 import re
 import sqlite3
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Optional, Tuple
 
 from flask import (
     Flask,
+    Response,
     jsonify,
     redirect,
     render_template,
     request,
-    send_file,
+    stream_with_context,
     url_for,
     flash,
+    g,
 )
 
 import pdfplumber
@@ -28,6 +33,8 @@ except Exception:  # pragma: no cover - optional OCR
 
 
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), "data.db")
+PAGE_SIZE = 100
+EXPORT_CHUNK_ROWS = 1000
 
 
 app = Flask(__name__)
@@ -49,6 +56,28 @@ def configure_tesseract() -> None:
 configure_tesseract()
 
 
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    # Created lazily so worker processes re-importing this module don't each
+    # start a pool of their own.
+    global _pdf_executor
+    if _pdf_executor is None:
+        # Windows' ProcessPoolExecutor refuses more than 61 workers.
+        _pdf_executor = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 61))
+    return _pdf_executor
+
+
+def reset_pdf_executor(broken: ProcessPoolExecutor) -> None:
+    # A pool whose worker died (OOM kill, native crash) can't run anything
+    # again; drop it so the next submission starts a fresh one.
+    global _pdf_executor
+    if _pdf_executor is broken:
+        _pdf_executor = None
+    broken.shutdown(wait=False)
+
+
 @dataclass
 class Transaction:
     date: datetime
@@ -59,48 +88,83 @@ class Transaction:
     category: Optional[str] = None
 
 
+@lru_cache(maxsize=4096)
 def strip_accents(text: str) -> str:
+    if text.isascii():
+        return text
+    # Only used for keyword matching, so dropping any remaining non-ASCII
+    # characters along with the combining marks is fine.
     normalized = unicodedata.normalize("NFD", text)
-    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return normalized.encode("ascii", "ignore").decode("ascii")
 
 
 def get_db_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # One connection per app context, closed by close_db_connection, so the
+    # page cache survives across the queries issued by a single request.
+    if "db" not in g:
+        conn = sqlite3.connect(DATABASE_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA mmap_size=268435456;")
+        conn.execute("PRAGMA cache_size=-20000;")
+        g.db = conn
+    return g.db
+
+
+@app.teardown_appcontext
+def close_db_connection(exc: Optional[BaseException]) -> None:
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.close()
 
 
 def init_db() -> None:
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with app.app_context():
+        conn = get_db_connection()
+        cur = conn.cursor()
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            description_full TEXT NOT NULL,
-            merchant_normalized TEXT NOT NULL,
-            txn_type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            category TEXT,
-            created_at TEXT NOT NULL
-        );
-        """
-    )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                description_full TEXT NOT NULL,
+                merchant_normalized TEXT NOT NULL,
+                txn_type TEXT NOT NULL,
+                amount REAL NOT NULL,
+                category TEXT,
+                created_at TEXT NOT NULL
+            );
+            """
+        )
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS merchant_category (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            merchant_normalized TEXT UNIQUE NOT NULL,
-            category TEXT NOT NULL
-        );
-        """
-    )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS merchant_category (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                merchant_normalized TEXT UNIQUE NOT NULL,
+                category TEXT NOT NULL
+            );
+            """
+        )
 
-    conn.commit()
-    conn.close()
+        # (date, txn_type) covers the dashboard's range + type filter.
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS ix_txn_date_type "
+            "ON transactions(date, txn_type);"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS ix_txn_merchant "
+            "ON transactions(merchant_normalized, txn_type);"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS ix_txn_category "
+            "ON transactions(category, txn_type);"
+        )
+
+        conn.commit()
 
 
 NORMALIZATION_PREFIXES = [
@@ -114,34 +178,46 @@ NORMALIZATION_PREFIXES = [
     "COMPRA CARTAO",
 ]
 
+CREDIT_KEYWORDS = ("CREDITO", "PIX RECEBIDO", "DEPOSITO")
 
+_BRL_TRANS = str.maketrans(
+    {"R": None, "$": None, "-": None, ".": None, ",": "."}
+)
+
+_RE_WS = re.compile(r"\s+")
+_RE_MONEY = re.compile(r"-?\d{1,3}(?:\.\d{3})*,\d{2}")
+_RE_DATELINE = re.compile(r"\d{2}/\d{2}/\d{4}")
+# CAIXA layout often includes "- HH:MM:SS" and a document number
+_RE_CAIXA_PREFIX = re.compile(r"^\s*(?:-\s*\d{2}:\d{2}:\d{2}\s*)?(?:\d{6,}\s*)?")
+_RE_PREFIX = re.compile(
+    r"^(?:" + "|".join(map(re.escape, NORMALIZATION_PREFIXES)) + r")[\s\-:/]*"
+)
+
+
+@lru_cache(maxsize=4096)
 def normalize_merchant(description: str) -> str:
-    text = re.sub(r"\s+", " ", description).strip()
-    upper = text.upper()
-    for prefix in NORMALIZATION_PREFIXES:
-        if upper.startswith(prefix):
-            trimmed = upper[len(prefix) :].strip(" -:/")
-            return re.sub(r"\s+", " ", trimmed)
-    return re.sub(r"\s+", " ", upper)
+    upper = _RE_WS.sub(" ", description).strip().upper()
+    m = _RE_PREFIX.match(upper)
+    if m:
+        # Separators after the prefix are consumed by the regex; only the
+        # trailing ones are left to strip.
+        return upper[m.end() :].rstrip(" -:/")
+    return upper
 
 
 def parse_brl_amount(raw: str) -> Optional[float]:
     if not raw:
         return None
-    txt = raw.strip()
-    txt = txt.replace("R$", "").strip()
-    is_negative = "-" in txt
-    txt = txt.replace("-", "")
-    txt = txt.replace(".", "").replace(",", ".")
+    # float() tolerates the surrounding whitespace the translate leaves behind,
+    # while inner spaces still make multi-token cells fail as before.
     try:
-        value = float(txt)
+        value = float(raw.translate(_BRL_TRANS))
     except ValueError:
         return None
-    if is_negative:
-        value = -value
-    return value
+    return -value if "-" in raw else value
 
 
+@lru_cache(maxsize=512)
 def parse_date(raw: str) -> Optional[datetime]:
     raw = raw.strip()
     for fmt in ("%d/%m/%Y", "%d/%m/%y"):
@@ -152,28 +228,61 @@ def parse_date(raw: str) -> Optional[datetime]:
     return None
 
 
-def extract_tables_from_pdf(file_bytes: bytes) -> List[List[str]]:
-    tables: List[List[str]] = []
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            page_tables = page.extract_tables() or []
-            for table in page_tables:
-                for row in table:
-                    if row and any(cell is not None for cell in row):
-                        tables.append([cell or "" for cell in row])
-    return tables
+@dataclass
+class PdfScan:
+    tables: List[List[str]]
+    page_lines: List[Optional[List[str]]]  # None until the page's text is read
+    image_pages: List[int]
+
+
+def extract_page_table_rows(page: pdfplumber.page.Page) -> List[List[str]]:
+    rows: List[List[str]] = []
+    for table in page.extract_tables() or []:
+        for row in table:
+            if row and any(cell is not None for cell in row):
+                rows.append([cell or "" for cell in row])
+    return rows
+
 
+def extract_page_lines(page: pdfplumber.page.Page) -> List[str]:
+    return (page.extract_text() or "").splitlines()
 
-def extract_text_lines_from_pdf(file_bytes: bytes) -> List[str]:
+
+def scan_pdf(pdf: pdfplumber.PDF) -> PdfScan:
+    # Each page is closed right after use, so memory stays bounded by a single
+    # page. The default "lines" table strategy builds tables from ruling edges
+    # only: pages without edges can't hold a table, so their text is read now
+    # while the page is loaded; text of pages with edges is only read later if
+    # the table parse finds nothing.
+    scan = PdfScan(tables=[], page_lines=[], image_pages=[])
+    for index, page in enumerate(pdf.pages):
+        if page.edges:
+            scan.tables.extend(extract_page_table_rows(page))
+            scan.page_lines.append(None)
+        else:
+            scan.page_lines.append(extract_page_lines(page))
+        if page.images:
+            scan.image_pages.append(index)
+        page.close()
+    return scan
+
+
+def extract_text_lines_from_pdf(pdf: pdfplumber.PDF, scan: PdfScan) -> List[str]:
     lines: List[str] = []
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text() or ""
-            lines.extend(text.splitlines())
+    for page, page_lines in zip(pdf.pages, scan.page_lines):
+        if page_lines is None:
+            page_lines = extract_page_lines(page)
+            page.close()
+        lines.extend(page_lines)
     return lines
 
 
-def extract_text_with_ocr(file_bytes: bytes) -> List[str]:
+def extract_text_with_ocr(pdf: pdfplumber.PDF, scan: PdfScan) -> List[str]:
+    # Only pages carrying an embedded image can be scans; blank or vector-only
+    # pages are never rasterized, and a PDF without images skips OCR entirely.
+    if not scan.image_pages:
+        return []
+
     if pytesseract is None:
         raise RuntimeError(
             "Este PDF parece ser uma imagem e requer OCR, mas o pytesseract não está disponível."
@@ -188,18 +297,19 @@ def extract_text_with_ocr(file_bytes: bytes) -> List[str]:
         )
 
     lang = os.environ.get("TESSERACT_LANG", "por")
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            image = page.to_image(resolution=250).original
+    for index in scan.image_pages:
+        page = pdf.pages[index]
+        image = page.to_image(resolution=250).original
+        page.close()
+        try:
+            text = pytesseract.image_to_string(image, lang=lang, config="--psm 6")
+        except Exception:
+            # Fallback if the requested language isn't installed (common on Windows).
             try:
-                text = pytesseract.image_to_string(image, lang=lang, config="--psm 6")
+                text = pytesseract.image_to_string(image, lang="eng", config="--psm 6")
             except Exception:
-                # Fallback if the requested language isn't installed (common on Windows).
-                try:
-                    text = pytesseract.image_to_string(image, lang="eng", config="--psm 6")
-                except Exception:
-                    text = pytesseract.image_to_string(image, config="--psm 6")
-            lines.extend(text.splitlines())
+                text = pytesseract.image_to_string(image, config="--psm 6")
+        lines.extend(text.splitlines())
     return lines
 
 
@@ -259,7 +369,7 @@ def parse_transactions_from_tables(tables: List[List[str]]) -> List[Transaction]
         if credit is None and debit is None:
             continue
 
-        description_full = re.sub(r"\s+", " ", description_raw).strip()
+        description_full = _RE_WS.sub(" ", description_raw).strip()
         merchant = normalize_merchant(description_full)
 
         if debit is not None and abs(debit) > 0:
@@ -293,7 +403,7 @@ def merge_wrapped_lines(lines: List[str]) -> List[str]:
         raw = (line or "").strip()
         if not raw:
             continue
-        is_new_txn = bool(re.match(r"^\d{2}/\d{2}/\d{4}", raw))
+        is_new_txn = bool(_RE_DATELINE.match(raw))
         if is_new_txn:
             if current:
                 merged.append(current)
@@ -311,37 +421,32 @@ def merge_wrapped_lines(lines: List[str]) -> List[str]:
 def parse_transactions_from_text_lines(lines: List[str]) -> List[Transaction]:
     transactions: List[Transaction] = []
 
-    money_pattern = re.compile(r"-?\d{1,3}(?:\.\d{3})*,\d{2}")
-
-    for line in merge_wrapped_lines(lines):
-        raw = line.strip()
-        if not raw:
+    # merge_wrapped_lines already strips and drops blank lines.
+    for raw in merge_wrapped_lines(lines):
+        # Each money value contains a decimal comma, so lines with fewer than
+        # two commas can't yield a transaction; skip the regex work for them.
+        if raw.count(",") < 2:
             continue
-
-        if not re.match(r"^\d{2}/\d{2}/\d{4}", raw):
+        if not _RE_DATELINE.match(raw):
             continue
-        date_raw = raw[:10]
-        rest = raw[10:].strip()
-        date = parse_date(date_raw)
+        date = parse_date(raw[:10])
         if not date:
             continue
 
-        upper_norm_rest = strip_accents(rest.upper())
-        if upper_norm_rest.startswith("DATA "):
+        # Only the first five characters matter for the header check, so
+        # avoid upper-casing and normalizing the whole line.
+        if strip_accents(raw[10:].lstrip()[:5].upper()) == "DATA ":
             continue
 
-        money_matches = list(money_pattern.finditer(raw))
+        money_matches = list(_RE_MONEY.finditer(raw))
         if len(money_matches) < 2:
             continue
 
-        first_money_start = money_matches[0].start()
-        description_raw = raw[len(date_raw) : first_money_start].strip()
-        # CAIXA layout often includes "- HH:MM:SS" and a document number
-        description_raw = re.sub(r"^\s*-\s*\d{2}:\d{2}:\d{2}\s*", "", description_raw)
-        description_raw = re.sub(r"^\s*\d{6,}\s*", "", description_raw)
-        description_raw = re.sub(r"\s+", " ", description_raw).strip()
+        description_raw = raw[10 : money_matches[0].start()].strip()
+        description_raw = _RE_CAIXA_PREFIX.sub("", description_raw, count=1)
+        description_raw = _RE_WS.sub(" ", description_raw).strip()
 
-        money_values = [raw[m.start() : m.end()] for m in money_matches]
+        money_values = [m.group() for m in money_matches]
 
         credit_raw = ""
         debit_raw = ""
@@ -352,10 +457,7 @@ def parse_transactions_from_text_lines(lines: List[str]) -> List[Transaction]:
         else:
             candidate = money_values[-2]
             desc_upper = strip_accents(description_raw.upper())
-            if any(
-                key in desc_upper
-                for key in ["CREDITO", "PIX RECEBIDO", "DEPOSITO"]
-            ):
+            if any(key in desc_upper for key in CREDIT_KEYWORDS):
                 credit_raw = candidate
             else:
                 debit_raw = candidate
@@ -366,7 +468,8 @@ def parse_transactions_from_text_lines(lines: List[str]) -> List[Transaction]:
         if credit is None and debit is None:
             continue
 
-        description_full = re.sub(r"\s+", " ", description_raw).strip()
+        # description_raw is already whitespace-collapsed and stripped above.
+        description_full = description_raw
         merchant = normalize_merchant(description_full)
 
         if debit is not None and abs(debit) > 0:
@@ -394,23 +497,25 @@ def parse_transactions_from_text_lines(lines: List[str]) -> List[Transaction]:
 
 
 def parse_transactions_from_pdf(file_bytes: bytes) -> List[Transaction]:
-    tables = extract_tables_from_pdf(file_bytes)
-    transactions = parse_transactions_from_tables(tables)
-    if transactions:
-        return transactions
+    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        scan = scan_pdf(pdf)
+        tables = scan.tables
+        transactions = parse_transactions_from_tables(tables)
+        if transactions:
+            return transactions
 
-    lines = extract_text_lines_from_pdf(file_bytes)
-    transactions = parse_transactions_from_text_lines(lines)
-    if transactions:
-        return transactions
+        lines = extract_text_lines_from_pdf(pdf, scan)
+        transactions = parse_transactions_from_text_lines(lines)
+        if transactions:
+            return transactions
 
-    # If there's no extractable text, try OCR for image-based PDFs.
-    has_any_text = any((l or "").strip() for l in lines)
-    if not has_any_text and not tables:
-        ocr_lines = extract_text_with_ocr(file_bytes)
-        return parse_transactions_from_text_lines(ocr_lines)
+        # If there's no extractable text, try OCR for image-based PDFs.
+        has_any_text = any((l or "").strip() for l in lines)
+        if has_any_text or tables:
+            return []
+        ocr_lines = extract_text_with_ocr(pdf, scan)
 
-    return []
+    return parse_transactions_from_text_lines(ocr_lines)
 
 
 def save_transactions(transactions: List[Transaction]) -> None:
@@ -419,102 +524,156 @@ def save_transactions(transactions: List[Transaction]) -> None:
     conn = get_db_connection()
     cur = conn.cursor()
 
-    cur.execute("SELECT merchant_normalized, category FROM merchant_category;")
-    known = {row["merchant_normalized"]: row["category"] for row in cur.fetchall()}
-
     now = datetime.utcnow().isoformat()
-    for txn in transactions:
-        category = known.get(txn.merchant_normalized)
-        cur.execute(
-            """
-            INSERT INTO transactions (
-                date, description_full, merchant_normalized,
-                txn_type, amount, category, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?);
-            """,
-            (
-                txn.date.date().isoformat(),
-                txn.description_full,
-                txn.merchant_normalized,
-                txn.txn_type,
-                txn.amount,
-                category,
-                now,
-            ),
+    rows = [
+        (
+            txn.date.date().isoformat(),
+            txn.description_full,
+            txn.merchant_normalized,
+            txn.txn_type,
+            txn.amount,
+            now,
         )
+        for txn in transactions
+    ]
+
+    # The known category is resolved per row by SQLite through the
+    # merchant_category unique index, instead of a Python-side lookup.
+    cur.execute("BEGIN;")
+    cur.executemany(
+        """
+        INSERT INTO transactions (
+            date, description_full, merchant_normalized,
+            txn_type, amount, category, created_at
+        ) VALUES (
+            ?1, ?2, ?3, ?4, ?5,
+            (SELECT category FROM merchant_category WHERE merchant_normalized = ?3),
+            ?6
+        );
+        """,
+        rows,
+    )
 
     conn.commit()
-    conn.close()
 
 
-def query_transactions(
+def build_transaction_filters(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     txn_type: Optional[str] = None,
     merchant: Optional[str] = None,
     category: Optional[str] = None,
-) -> List[sqlite3.Row]:
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    query = "SELECT * FROM transactions WHERE 1=1"
+) -> Tuple[str, List[object]]:
+    where = "WHERE 1=1"
     params: List[object] = []
 
     if start_date:
-        query += " AND date >= ?"
+        where += " AND date >= ?"
         params.append(start_date)
     if end_date:
-        query += " AND date <= ?"
+        where += " AND date <= ?"
         params.append(end_date)
     if txn_type in ("credit", "debit"):
-        query += " AND txn_type = ?"
+        where += " AND txn_type = ?"
         params.append(txn_type)
     if merchant:
-        query += " AND merchant_normalized LIKE ?"
+        where += " AND merchant_normalized LIKE ?"
         params.append(f"%{merchant}%")
     if category:
-        query += " AND IFNULL(category, '') = ?"
+        where += " AND IFNULL(category, '') = ?"
         params.append(category)
 
-    query += " ORDER BY date ASC, id ASC"
+    return where, params
 
-    cur.execute(query, params)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
 
+def iter_transactions(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    txn_type: Optional[str] = None,
+    merchant: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> sqlite3.Cursor:
+    where, params = build_transaction_filters(
+        start_date, end_date, txn_type, merchant, category
+    )
+    query = f"SELECT * FROM transactions {where} ORDER BY date ASC, id ASC"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    return get_db_connection().execute(query, params)
 
-def aggregate_totals(rows: List[sqlite3.Row]) -> Tuple[float, float]:
-    total_spent = 0.0
-    total_received = 0.0
-    for row in rows:
-        if row["txn_type"] == "debit":
-            total_spent += float(row["amount"])
-        elif row["txn_type"] == "credit":
-            total_received += float(row["amount"])
-    return total_spent, total_received
 
+def query_transactions(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    txn_type: Optional[str] = None,
+    merchant: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> List[sqlite3.Row]:
+    return iter_transactions(
+        start_date, end_date, txn_type, merchant, category, limit, offset
+    ).fetchall()
 
-def aggregate_by_merchant(rows: List[sqlite3.Row]) -> List[Tuple[str, float]]:
-    agg: dict[str, float] = {}
-    for row in rows:
-        if row["txn_type"] != "debit":
-            continue
-        merchant = row["merchant_normalized"]
-        agg[merchant] = agg.get(merchant, 0.0) + float(row["amount"])
-    sorted_items = sorted(agg.items(), key=lambda x: x[1], reverse=True)
-    return sorted_items
 
+def aggregate_dashboard(
+    where: str, params: List[object], merchant_limit: int = 10
+) -> Tuple[int, float, float, List[Tuple[str, float]], List[Tuple[str, float]]]:
+    # One tagged UNION ALL query returns the row count, the totals and both
+    # chart breakdowns, so the dashboard needs a single round-trip for them.
+    cur = get_db_connection().cursor()
+    cur.execute(
+        f"""
+        SELECT 'cnt' AS k, NULL AS label, COUNT(*) AS v
+        FROM transactions {where}
+        UNION ALL
+        SELECT 'tot', txn_type, SUM(amount)
+        FROM transactions {where}
+        GROUP BY txn_type
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'mer', merchant_normalized, SUM(amount) AS v
+            FROM transactions {where} AND txn_type = 'debit'
+            GROUP BY merchant_normalized
+            ORDER BY v DESC
+            LIMIT ?
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'cat', COALESCE(NULLIF(category, ''), 'Outros') AS cat, SUM(amount) AS v
+            FROM transactions {where} AND txn_type = 'debit'
+            GROUP BY cat
+            ORDER BY v DESC
+        );
+        """,
+        [*params, *params, *params, merchant_limit, *params],
+    )
 
-def aggregate_by_category(rows: List[sqlite3.Row]) -> List[Tuple[str, float]]:
-    agg: dict[str, float] = {}
-    for row in rows:
-        if row["txn_type"] != "debit":
-            continue
-        cat = row["category"] or "Outros"
-        agg[cat] = agg.get(cat, 0.0) + float(row["amount"])
-    sorted_items = sorted(agg.items(), key=lambda x: x[1], reverse=True)
-    return sorted_items
+    count = 0
+    totals: dict[str, float] = {}
+    by_merchant: List[Tuple[str, float]] = []
+    by_category: List[Tuple[str, float]] = []
+    for row in cur.fetchall():
+        kind = row["k"]
+        if kind == "cnt":
+            count = row["v"]
+        elif kind == "tot":
+            totals[row["label"]] = row["v"]
+        elif kind == "mer":
+            by_merchant.append((row["label"], row["v"]))
+        else:
+            by_category.append((row["label"], row["v"]))
+
+    return (
+        count,
+        totals.get("debit", 0.0),
+        totals.get("credit", 0.0),
+        by_merchant,
+        by_category,
+    )
 
 
 @app.route("/", methods=["GET"])
@@ -524,20 +683,30 @@ def index():
     txn_type = request.args.get("type") or ""
     merchant = request.args.get("merchant") or ""
     category = request.args.get("category") or ""
+    page = max(request.args.get("page", 1, type=int), 1)
 
-    rows = query_transactions(
+    filter_args = dict(
         start_date=start or None,
         end_date=end or None,
         txn_type=txn_type or None,
         merchant=merchant or None,
         category=category or None,
     )
-
-    total_spent, total_received = aggregate_totals(rows)
+    where, params = build_transaction_filters(**filter_args)
+    (
+        txn_count,
+        total_spent,
+        total_received,
+        by_merchant,
+        by_category,
+    ) = aggregate_dashboard(where, params)
     balance = total_received - total_spent
 
-    by_merchant = aggregate_by_merchant(rows)
-    by_category = aggregate_by_category(rows)
+    page_count = max((txn_count + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    page = min(page, page_count)
+    rows = query_transactions(
+        **filter_args, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE
+    )
 
     conn = get_db_connection()
     cur = conn.cursor()
@@ -571,7 +740,6 @@ def index():
         "FROM transactions ORDER BY category;"
     )
     categories = [r["category"] for r in cur.fetchall()]
-    conn.close()
 
     return render_template(
         "index.html",
@@ -579,11 +747,13 @@ def index():
         total_spent=total_spent,
         total_received=total_received,
         balance=balance,
-        by_merchant=by_merchant[:10],
+        by_merchant=by_merchant,
         by_category=by_category,
         merchant_unassigned=merchant_unassigned,
         merchant_assigned=merchant_assigned,
         categories=categories,
+        page=page,
+        page_count=page_count,
         filters={
             "start_date": start,
             "end_date": end,
@@ -601,22 +771,42 @@ def upload():
         return redirect(url_for("index"))
 
     files = request.files.getlist("pdf_files")
-    all_transactions: List[Transaction] = []
+    pdf_files: List[Tuple[str, bytes]] = []
     for f in files:
         if not f.filename.lower().endswith(".pdf"):
             flash(f"Arquivo ignorado (não é PDF): {f.filename}", "warning")
             continue
-        file_bytes = f.read()
+        pdf_files.append((f.filename, f.read()))
+
+    # Parsing is CPU-bound (pdfminer is pure Python), so multiple PDFs are
+    # spread over worker processes; the database write stays in this thread.
+    executor = get_pdf_executor()
+    futures = []
+    for filename, file_bytes in pdf_files:
         try:
-            txns = parse_transactions_from_pdf(file_bytes)
+            future = executor.submit(parse_transactions_from_pdf, file_bytes)
+        except BrokenProcessPool:
+            reset_pdf_executor(executor)
+            executor = get_pdf_executor()
+            future = executor.submit(parse_transactions_from_pdf, file_bytes)
+        futures.append((filename, executor, future))
+
+    all_transactions: List[Transaction] = []
+    for filename, pool, future in futures:
+        try:
+            txns = future.result()
+        except BrokenProcessPool:
+            reset_pdf_executor(pool)
+            flash(f"Erro ao processar PDF: {filename}", "danger")
+            continue
         except RuntimeError as e:
-            flash(f"{f.filename}: {e}", "danger")
+            flash(f"{filename}: {e}", "danger")
             continue
         except Exception:
-            flash(f"Erro ao processar PDF: {f.filename}", "danger")
+            flash(f"Erro ao processar PDF: {filename}", "danger")
             continue
         if not txns:
-            flash(f"Nenhuma transação encontrada em: {f.filename}", "warning")
+            flash(f"Nenhuma transação encontrada em: {filename}", "warning")
         all_transactions.extend(txns)
 
     if all_transactions:
@@ -656,7 +846,6 @@ def update_category():
     )
 
     conn.commit()
-    conn.close()
 
     return jsonify({"ok": True})
 
@@ -681,36 +870,41 @@ def clear_category():
     )
 
     conn.commit()
-    conn.close()
 
     return jsonify({"ok": True})
 
 
 @app.route("/export", methods=["GET"])
 def export_csv():
-    rows = query_transactions()
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=";")
-    writer.writerow(
-        ["Data", "Descrição completa", "Favorecido", "Tipo", "Valor", "Categoria"]
-    )
-    for row in rows:
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=";")
+        # UTF-8 BOM so Excel detects the encoding, as utf-8-sig did before.
+        output.write("\ufeff")
         writer.writerow(
-            [
-                row["date"],
-                row["description_full"],
-                row["merchant_normalized"],
-                row["txn_type"],
-                f"{float(row['amount']):.2f}".replace(".", ","),
-                row["category"] or "",
-            ]
+            ["Data", "Descrição completa", "Favorecido", "Tipo", "Valor", "Categoria"]
         )
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode("utf-8-sig")),
+        for i, row in enumerate(iter_transactions(), start=1):
+            writer.writerow(
+                [
+                    row["date"],
+                    row["description_full"],
+                    row["merchant_normalized"],
+                    row["txn_type"],
+                    f"{float(row['amount']):.2f}".replace(".", ","),
+                    row["category"] or "",
+                ]
+            )
+            if i % EXPORT_CHUNK_ROWS == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+        yield output.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
         mimetype="text/csv; charset=utf-8",
-        as_attachment=True,
-        download_name="transacoes.csv",
+        headers={"Content-Disposition": "attachment; filename=transacoes.csv"},
     )
 
 
@@ -720,7 +914,6 @@ def clear_data():
     cur = conn.cursor()
     cur.execute("DELETE FROM transactions;")
     conn.commit()
-    conn.close()
     flash("Dados importados apagados (categorias mantidas).", "success")
     return redirect(url_for("index"))
 